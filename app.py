@@ -1,13 +1,13 @@
+import inspect
+
 import streamlit as st
+import streamlit.components.v1 as components
 import pydeck as pdk
-import pandas as pd
 import numpy as np
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 from shapely.geometry import Point, Polygon
-from shapely.ops import transform
-import pyproj
-from functools import partial
+from shapely.prepared import prep
+
+from geocoding import geocode_address
 
 # Set page config for dark theme
 st.set_page_config(
@@ -46,55 +46,14 @@ WATERLOO_ZONE = {
     'height_limit': 100  # meters
 }
 
-# Function to check if a point is within Waterloo zone
-def is_in_waterloo_zone(lon, lat):
-    point = Point(lon, lat)
-    polygon = Polygon(WATERLOO_ZONE['coordinates'])
-    return polygon.contains(point)
-
-# Function to calculate distance to Waterloo center
-def distance_to_waterloo(lon, lat):
-    # Convert lat/lon to meters using geodesic distance
-    geod = pyproj.Geod(ellps='WGS84')
-    _, _, distance = geod.inv(
-        WATERLOO_ZONE['center'][0],
-        WATERLOO_ZONE['center'][1],
-        lon,
-        lat
-    )
-    return distance
-
-# Initialize the geocoder
+# Build the prepared Waterloo zone polygon once and share it across reruns
 @st.cache_resource
-def get_geocoder():
-    return Nominatim(user_agent="building_visualizer")
-
-# Function to geocode address
-def geocode_address(address):
-    geocoder = get_geocoder()
-    try:
-        location = geocoder.geocode(address)
-        if location:
-            return location.latitude, location.longitude, location.address
-        return None, None, None
-    except (GeocoderTimedOut, GeocoderUnavailable):
-        return None, None, None
+def get_waterloo_polygon():
+    return prep(Polygon(WATERLOO_ZONE['coordinates']))
 
-# Function to rotate points around center
-def rotate_points(points, angle_degrees, center):
-    angle = np.radians(angle_degrees)
-    cos_angle = np.cos(angle)
-    sin_angle = np.sin(angle)
-    
-    rotated_points = []
-    for point in points:
-        px = point[0] - center[0]
-        py = point[1] - center[1]
-        rx = px * cos_angle - py * sin_angle
-        ry = px * sin_angle + py * cos_angle
-        rotated_points.append([rx + center[0], ry + center[1]])
-    
-    return rotated_points
+# Function to check if a point is within Waterloo zone
+def is_in_waterloo_zone(lon, lat):
+    return get_waterloo_polygon().contains(Point(lon, lat))
 
 # Title and description
 st.title("ZoningLLM - 3D Building Visualizer")
@@ -123,8 +82,14 @@ with location_tab:
         st.write("")  # Creates a small vertical space
         if st.button("Search", key="search_button", use_container_width=True):
             with st.spinner("Looking up address..."):
-                lat, lon, formatted_address = geocode_address(address)
+                # Re-searching the last found address reuses its result without a lookup
+                if address == st.session_state.get('last_queried_address'):
+                    lat, lon, formatted_address = st.session_state.last_geocode
+                else:
+                    lat, lon, formatted_address = geocode_address(address)
                 if lat and lon:
+                    st.session_state.last_queried_address = address
+                    st.session_state.last_geocode = (lat, lon, formatted_address)
                     st.session_state.latitude = lat
                     st.session_state.longitude = lon
                     st.session_state.formatted_address = formatted_address
@@ -146,6 +111,8 @@ with coords_tab:
         st.session_state.latitude = st.number_input(
             "Latitude",
             value=st.session_state.latitude,
+            min_value=-90.0,
+            max_value=90.0,
             format="%.6f",
             help="Enter the latitude coordinate"
         )
@@ -183,78 +150,113 @@ with col4:
                         help="Rotate building relative to true north")
     st.session_state.rotation = rotation
 
-# Create building data
+# Approximate degrees of latitude per meter (one degree is ~111.111 km)
+DEGREES_PER_METER = 1 / 111111
+
+# Corners of a unit footprint (SW, SE, NE, NW), scaled to the building's half-extents
+UNIT_SQUARE = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=float)
+
+# Create building data (cached on the location, dimensions and rotation)
+@st.cache_data(max_entries=256, show_spinner=False)
 def create_building_data(lon, lat, height, length, width, rotation):
-    meter_to_coord = 0.00001
-    half_length = (length * meter_to_coord) / 2
-    half_width = (width * meter_to_coord) / 2
+    # Degrees of longitude shrink with cos(latitude); degrees of latitude do not
+    lat_scale = DEGREES_PER_METER
+    # Floored so footprints stay finite next to the poles
+    lon_scale = DEGREES_PER_METER / max(np.cos(np.radians(lat)), 0.01)
     
-    polygon = [
-        [lon - half_width, lat - half_length],
-        [lon + half_width, lat - half_length],
-        [lon + half_width, lat + half_length],
-        [lon - half_width, lat + half_length]
-    ]
+    angle = np.radians(rotation)
+    cos_angle = np.cos(angle)
+    sin_angle = np.sin(angle)
+    rotation_matrix = np.array([
+        [cos_angle, -sin_angle],
+        [sin_angle, cos_angle]
+    ])
     
-    center = [lon, lat]
-    rotated_polygon = rotate_points(polygon, rotation, center)
+    # Size in meters, rotate in meters, then convert to degrees: one combined 2x2 transform
+    transform = np.diag([lon_scale, lat_scale]) @ rotation_matrix @ np.diag([width / 2, length / 2])
+    # 6 decimal places is ~0.1 m, so trimming the rest only shrinks the JSON sent to the browser
+    polygon = np.round(UNIT_SQUARE @ transform.T + [lon, lat], 6).tolist()
     
-    return pd.DataFrame({
-        'polygon': [rotated_polygon],
-        'height': [height]
-    })
+    return [{'polygon': polygon, 'height': height}]
 
 # Create Waterloo zone data
 def create_zone_data():
-    return pd.DataFrame({
-        'polygon': [WATERLOO_ZONE['coordinates']],
-        'height': [20]  # Height of zone visualization
-    })
+    return [{
+        'polygon': WATERLOO_ZONE['coordinates'],
+        'height': 20  # Height of zone visualization
+    }]
+
+# Create wireframe edges (base, roof and corners) for an extruded polygon
+def create_edge_data(polygon, height):
+    height = float(height)
+    edges = []
+    for i, start in enumerate(polygon):
+        end = polygon[(i + 1) % len(polygon)]
+        edges.append({'source': [*start, 0], 'target': [*end, 0]})
+        edges.append({'source': [*start, height], 'target': [*end, height]})
+        edges.append({'source': [*start, 0], 'target': [*start, height]})
+    return edges
+
+# Create compass label data at the map center
+def create_compass_data(center_lon, center_lat):
+    return [{'position': [center_lon, center_lat]}]
 
 # Create the 3D visualization
 def create_3d_map(building_data, center_lon, center_lat):
-    # Building layer
+    # Building layer (fill only; outlines are drawn by a separate line layer
+    # so deck.gl does not have to tessellate polygon strokes)
     building_layer = pdk.Layer(
-        'PolygonLayer',
+        'SolidPolygonLayer',
         building_data,
+        id='building',
         get_polygon='polygon',
         get_elevation='height',
         elevation_scale=1,
         extruded=True,
         filled=True,
-        wireframe=True,
         get_fill_color=[169, 169, 169, 200],
-        get_line_color=[0, 0, 0],
         pickable=True
     )
     
+    building_outline_layer = pdk.Layer(
+        'LineLayer',
+        create_edge_data(building_data[0]['polygon'], building_data[0]['height']),
+        id='building-outline',
+        get_source_position='source',
+        get_target_position='target',
+        get_color=[0, 0, 0]
+    )
+    
     # Waterloo zone layer
+    zone_data = create_zone_data()
     zone_layer = pdk.Layer(
-        'PolygonLayer',
-        create_zone_data(),
+        'SolidPolygonLayer',
+        zone_data,
         get_polygon='polygon',
         get_elevation='height',
         elevation_scale=1,
         extruded=True,
         filled=True,
-        wireframe=True,
         get_fill_color=[255, 0, 0, 50],  # Semi-transparent red
-        get_line_color=[255, 0, 0],
         pickable=False
     )
     
-    # Compass indicator
-    compass_data = pd.DataFrame({
-        'position': [[center_lon, center_lat]],
-        'angle': [0]
-    })
+    zone_outline_layer = pdk.Layer(
+        'LineLayer',
+        create_edge_data(zone_data[0]['polygon'], zone_data[0]['height']),
+        get_source_position='source',
+        get_target_position='target',
+        get_color=[255, 0, 0]
+    )
     
+    # Compass indicator
     compass_layer = pdk.Layer(
         'TextLayer',
-        compass_data,
+        create_compass_data(center_lon, center_lat),
+        id='compass',
         get_position='position',
         get_text='N',
-        get_angle='angle',
+        get_angle=0,
         get_size=18,
         get_color=[255, 0, 0],
         get_alignment_baseline="'bottom'",
@@ -272,13 +274,35 @@ def create_3d_map(building_data, center_lon, center_lat):
     
     # Create the deck
     deck = pdk.Deck(
-        layers=[zone_layer, building_layer, compass_layer],
+        layers=[zone_layer, zone_outline_layer, building_layer, building_outline_layer, compass_layer],
         initial_view_state=view_state,
-        map_style='mapbox://styles/mapbox/dark-v10',
+        # CARTO tiles need no API token, so the basemap renders on both the
+        # st.pydeck_chart and the standalone deck.to_html() paths
+        map_provider='carto',
+        map_style='dark',
     )
     
     return deck
 
+# Point an existing deck at new building data and center, reusing its layers
+def update_3d_map(deck, building_data, center_lon, center_lat):
+    layers = {layer.id: layer for layer in deck.layers}
+    layers['building'].data = building_data
+    layers['building-outline'].data = create_edge_data(building_data[0]['polygon'], building_data[0]['height'])
+    
+    # The compass only has to move when the location does
+    view_state = deck.initial_view_state
+    if (view_state.longitude, view_state.latitude) != (center_lon, center_lat):
+        layers['compass'].data = create_compass_data(center_lon, center_lat)
+        view_state.longitude = center_lon
+        view_state.latitude = center_lat
+
+# Fingerprint of the code that builds the deck, so a deck built by different code
+# (e.g. kept in session state across a script reload) is detected and rebuilt
+def get_deck_signature():
+    builders = (create_3d_map, create_zone_data, create_edge_data, create_compass_data)
+    return hash(''.join(inspect.getsource(builder) for builder in builders))
+
 # Create and display the map
 st.subheader("3D Visualization")
 building_data = create_building_data(
@@ -289,8 +313,35 @@ building_data = create_building_data(
     width,
     rotation
 )
-deck = create_3d_map(building_data, st.session_state.longitude, st.session_state.latitude)
-st.pydeck_chart(deck)
+# The deck and its zone layers are built once per session; later reruns only swap in new data.
+# Session state outlives script reloads, so a deck built by other code is replaced.
+deck_signature = get_deck_signature()
+if st.session_state.get('deck_signature') != deck_signature:
+    st.session_state.deck = create_3d_map(building_data, st.session_state.longitude, st.session_state.latitude)
+    st.session_state.deck_signature = deck_signature
+else:
+    update_3d_map(st.session_state.deck, building_data, st.session_state.longitude, st.session_state.latitude)
+deck = st.session_state.deck
+
+# Raw deck.gl HTML pans and zooms far more smoothly than st.pydeck_chart, but the
+# native chart keeps the camera where the user left it when the building changes
+preserve_view = st.toggle(
+    "Preserve view state",
+    value=False,
+    help="Keep the camera position between updates (slower interaction)"
+)
+if preserve_view:
+    st.pydeck_chart(deck)
+else:
+    # This path re-serializes the whole deck to HTML on every rerun, so it gets
+    # nothing from the in-place layer updates above
+    deck_html = deck.to_html(as_string=True, offline=False)
+    # Newer Streamlit releases deprecate components.html in favour of st.iframe,
+    # which embeds an HTML string the same way
+    if hasattr(st, 'iframe'):
+        st.iframe(deck_html, height=650)
+    else:
+        components.html(deck_html, height=650, scrolling=False)
 
 # Add information about the visualization
 with st.expander("About this visualization"):
@@ -309,7 +360,7 @@ with st.expander("About this visualization"):
     - {'Location is within' if in_waterloo else 'Location is outside'} the Waterloo zone
     - Waterloo zone height limit: {WATERLOO_ZONE['height_limit']} meters
     
-    The building is rendered on a dark-themed MapBox map, with the building shown as a 3D extrusion.
+    The building is rendered on a dark-themed CARTO basemap, with the building shown as a 3D extrusion.
     The red semi-transparent zone indicates the Waterloo area with height restrictions.
     
     You can:
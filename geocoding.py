@@ -0,0 +1,53 @@
+from functools import partial
+
+import streamlit as st
+from geopy.adapters import RequestsAdapter
+from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderServiceError
+from geopy.extra.rate_limiter import RateLimiter
+
+# Seconds to wait on Nominatim before giving up on a lookup
+GEOCODE_TIMEOUT = 5
+# Retries after a failed lookup, and seconds to wait before each one
+GEOCODE_MAX_RETRIES = 1
+GEOCODE_RETRY_WAIT = 1
+# The RateLimiter is the only retry layer (the HTTP adapter's own retries are
+# off), so a stalled Nominatim holds a search for two timed-out attempts and
+# the wait between them: 5 + 1 + 5 = 11 seconds
+
+# Initialize the geocoder
+# A single cached instance keeps one pooled requests.Session alive, so the
+# TCP/TLS connection to Nominatim is reused across lookups and reruns.
+# Lookups are throttled to one per second per the Nominatim usage policy.
+@st.cache_resource
+def get_geocoder():
+    nominatim = Nominatim(
+        user_agent="building_visualizer",
+        timeout=GEOCODE_TIMEOUT,
+        adapter_factory=partial(RequestsAdapter, pool_connections=4, pool_maxsize=8, max_retries=0)
+    )
+    return RateLimiter(
+        nominatim.geocode,
+        min_delay_seconds=1,
+        max_retries=GEOCODE_MAX_RETRIES,
+        error_wait_seconds=GEOCODE_RETRY_WAIT,
+        swallow_exceptions=False
+    )
+
+# Look up an address on Nominatim (results cached for a day per address)
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def lookup_address(address):
+    geocode = get_geocoder()
+    location = geocode(address, timeout=GEOCODE_TIMEOUT)
+    if location:
+        return location.latitude, location.longitude, location.address
+    return None, None, None
+
+# Function to geocode address
+# Service errors (timeouts, outages, rate limiting) are caught outside the
+# cached lookup so a failure is retried on the next search instead of cached.
+def geocode_address(address):
+    try:
+        return lookup_address(address)
+    except GeocoderServiceError:
+        return None, None, None